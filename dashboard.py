@@ -1,9 +1,10 @@
 import streamlit as st
 import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd 
-from datetime import datetime, timedelta
-import math # Import math for floor division
+import pandas as pd
+
+from data_quality import DataValidationError
+from license_forecast import get_snapshot_forecast
+from license_metrics import INACTIVE_AFTER_DAYS, get_license_snapshot
 
 # Matplotlib font setting for Korean characters
 plt.rcParams['font.family'] = 'Malgun Gothic' # For Windows
@@ -12,64 +13,6 @@ plt.rcParams['axes.unicode_minus'] = False # To prevent minus sign from breaking
 # plt.rcParams['font.family'] = 'AppleGothic'
 # For Linux, you might need to install a font like 'NanumGothic' and configure it.
 
-# Helper functions for date parsing and status determination
-def parse_full_datetime(date_part, time_part):
-    """Parses date and time strings (including 오전/오후) into a datetime object."""
-    if pd.isna(date_part) or pd.isna(time_part):
-        return None
-    
-    full_str = f"{date_part} {time_part}"
-    try:
-        if '오전' in full_str:
-            return datetime.strptime(full_str.replace('오전 ', ''), '%Y-%m-%d %I:%M:%S')
-        elif '오후' in full_str:
-            return datetime.strptime(full_str.replace('오후 ', ''), '%Y-%m-%d %I:%M:%S')
-        else: # Assume 24-hour if no 오전/오후 marker
-            return datetime.strptime(full_str, '%Y-%m-%d %H:%M:%S')
-    except ValueError:
-        return None
-
-def parse_ymd_or_ym_date(date_str):
-    """Parses YYYYMMDD or YYYYMM date strings into a datetime object."""
-    if pd.isna(date_str) or date_str == '':
-        return None
-    s_date_str = str(date_str)
-    try:
-        if len(s_date_str) == 8: # YYYYMMDD
-            return datetime.strptime(s_date_str, '%Y%m%d')
-        elif len(s_date_str) == 6: # YYYYMM, default to first day of month
-            return datetime.strptime(s_date_str + '01', '%Y%m%d')
-    except ValueError:
-        pass
-    return None
-
-def get_user_status_for_recent_activity(row):
-    """Determines user status (Active, Expiring, Inactive) and expiry string."""
-    today = datetime.now()
-    
-    last_logon_dt = parse_full_datetime(row['LASTLOGONDATE'], row['LASTLOGONTIME'])
-    expiry_end_dt = parse_ymd_or_ym_date(row['EXPIRATIONENDDATE'])
-    
-    status_text = "Active"
-    expiry_display = "Expires 9999.12.30" # Default for no specific expiry in CSV or very long expiry
-
-    # Determine expiry display string
-    if pd.notna(row['EXPIRATIONENDDATE']):
-        if str(row['EXPIRATIONENDDATE']) == '99991230': # Special handling for "never expires"
-            expiry_display = "Expires 9999.12.30"
-        elif expiry_end_dt:
-            expiry_display = f"Expires {expiry_end_dt.strftime('%Y.%m.%d')}"
-    
-    # Determine status based on the provided logic
-    if expiry_end_dt and expiry_end_dt < today:
-        status_text = "Inactive" # Expired
-    elif last_logon_dt and last_logon_dt < today - timedelta(days=30):
-        status_text = "Inactive" # No recent login for 30+ days
-    elif expiry_end_dt and expiry_end_dt >= today and expiry_end_dt < today + timedelta(days=90):
-        status_text = "Expiring" # Expiring within 90 days
-
-    return status_text, expiry_display
-
 # 페이지 설정 (한 번만 선언)
 st.set_page_config(layout="wide")
 
@@ -320,6 +263,58 @@ for item in menu_items:
 menu_html += '</div>'
 st.markdown(menu_html, unsafe_allow_html=True)
 
+def render_data_quality(quality_report):
+    """Renders the data-quality report: per-check counts and sampled row-level diagnostics."""
+    with st.container(border=True):
+        st.markdown('<div class="widget-title">Data Quality</div>', unsafe_allow_html=True)
+        rows_checked = ', '.join(f"{name}: {count} rows" for name, count in quality_report['rows_checked'].items())
+        st.markdown(f"{'Passed' if quality_report['passed'] else 'Failed'} ({rows_checked or 'no rows checked'})")
+        if quality_report['summary']:
+            st.dataframe(pd.DataFrame(quality_report['summary']), hide_index=True, use_container_width=True)
+        else:
+            st.markdown("No issues found.")
+        if quality_report['issues']:
+            with st.expander("Row-level diagnostics"):
+                st.dataframe(pd.DataFrame(quality_report['issues']), hide_index=True, use_container_width=True)
+
+try:
+    # Validate and stream the exports in chunks; undecodable or malformed rows are quarantined and reported.
+    # The snapshot is cached per export fingerprint and shared with license_api.py, so reruns do not re-read the files.
+    license_snapshot = get_license_snapshot('zalmt0020.csv', 'zalmt0030.csv')
+except FileNotFoundError:
+    st.error("zalmt0020.csv file not found. License figures cannot be shown without the export.")
+    st.stop()
+except DataValidationError as e:
+    # Fail fast: show what is wrong with the export instead of license numbers computed from it
+    st.error(f"{e}. License figures are not shown until the export is fixed.")
+    render_data_quality(e.report)
+    st.stop()
+
+license_metrics = license_snapshot['metrics']
+ingest_report = license_metrics['ingest']
+for warning in license_metrics['warnings']:
+    st.warning(warning)
+if ingest_report['rows_quarantined']:
+    st.warning(
+        f"{ingest_report['rows_quarantined']} rows in zalmt0020.csv ({ingest_report['encoding']}) could not be read and were quarantined "
+        f"(lines {', '.join(map(str, ingest_report['quarantined_lines']))}). Counts exclude these rows."
+    )
+if ingest_report['rows_replaced']:
+    st.warning(f"{ingest_report['rows_replaced']} rows in zalmt0020.csv contained invalid characters, which were replaced.")
+
+user_count = license_metrics['user_count']
+inactive_users_count = license_metrics['inactive_users_count']
+recent_users_data = license_metrics['recent_users_data']
+raw_user_license_counts = license_metrics['raw_user_license_counts'] # For User section's User License Type widget
+calculated_fue_license_counts = license_metrics['calculated_fue_license_counts'] # For FUE License section calculations
+active_license_count = license_metrics['active_license_count']
+total_license_capacity = license_metrics['total_license_capacity']
+remaining_license_count = license_metrics['remaining_license_count']
+license_utilization_rate = license_metrics['license_utilization_rate']
+# Cached per snapshot fingerprint, so reruns (e.g. moving a slider) do not recompute the projections
+fue_forecast = get_snapshot_forecast(license_snapshot) # Expiry and 30-day logon window
+licensed_forecast = get_snapshot_forecast(license_snapshot, inactive_after_days=None) # Expiry only, same basis as Active License
+
 # Section title
 st.markdown('<div class="section-title">Overview</div>', unsafe_allow_html=True)
 
@@ -331,42 +326,44 @@ with cols_overview_row1[0]:
     with st.container(height=360, border=True): # 2x2 ratio (width:height = 1:1)
         st.markdown('<div class="widget-title">FUE License Status</div>', unsafe_allow_html=True)
         st.markdown('<div class="widget-content">', unsafe_allow_html=True)
-        st.markdown("""
+        st.markdown(f"""
             <div class="stat-block">
-                <div><div class="stat-label">Active Licenses</div><div class="stat-value">292</div></div>
-                <div><div class="stat-label">Total License</div><div class="stat-value">500</div></div>
-                <div><div class="stat-value">Transaction Based</div><div class="stat-value">271</div></div>
+                <div><div class="stat-label">Active Licenses</div><div class="stat-value">{active_license_count}</div></div>
+                <div><div class="stat-label">Total License</div><div class="stat-value">{total_license_capacity}</div></div>
+                <div><div class="stat-label">Remaining</div><div class="stat-value">{remaining_license_count}</div></div>
             </div>
             <hr style="margin: 1rem 0;">
         """, unsafe_allow_html=True)
 
-        active_pct = 292 / 500 * 100
+        active_pct = min(license_utilization_rate, 100) # Over capacity shows as a full pie; the numbers above show the overage
         fig1, ax1 = plt.subplots(figsize=(3, 3)) # Maintain 1:1 ratio
         colors = ['#007BFF', '#FFA500']
-        ax1.pie([active_pct, 100 - active_pct], labels=[f'Active ({active_pct:.1f}%)', 'Remaining'], autopct='%1.1f%%', startangle=90, colors=colors)
+        ax1.pie([active_pct, 100 - active_pct], labels=[f'Active ({license_utilization_rate:.1f}%)', 'Remaining'], autopct='%1.1f%%', startangle=90, colors=colors)
         ax1.set_aspect('equal')
         st.pyplot(fig1, use_container_width=True)
         st.markdown('</div>', unsafe_allow_html=True)
 
-# Widget 2: FUE Active License Variance (2x2 size)
+# Widget 2: FUE Capacity Forecast (2x2 size)
 with cols_overview_row1[1]:
     with st.container(height=360, border=True): # 2x2 ratio (width:height = 1:1)
-        st.markdown('<div class="widget-title">FUE Active License Variance</div>', unsafe_allow_html=True)
+        st.markdown('<div class="widget-title">FUE Capacity Forecast</div>', unsafe_allow_html=True)
         st.markdown('<div class="widget-content">', unsafe_allow_html=True)
-
-        base = 292
-        months = ['Apr', 'May', 'Jun', 'Jul'] # Months in English
-        values = [base]
-        for _ in range(3):
-            base *= np.random.uniform(0.85, 0.95)
-            values.insert(0, int(base))
-
-        fig3, ax3 = plt.subplots(figsize=(4, 3)) # Adjust to near 1:1 ratio
-        bar_colors = ['#D3D3D3'] * (len(months) - 1) + ['#007BFF']
-        ax3.bar(months, values, color=bar_colors)
-        ax3.set_ylabel("Licenses")
-        ax3.set_title("Active Licenses in Last 4 Months") # Title in English
-        st.pyplot(fig3, use_container_width=True)
+        if not license_snapshot['users'].empty:
+            # First point is today. "Licensed" starts from the Active License basis and drops only at expiry;
+            # "In use" also drops each user 30 days after their last logon, assuming no further logons.
+            fig3, ax3 = plt.subplots(figsize=(4, 3)) # Adjust to near 1:1 ratio
+            month_labels = ['Now'] + list(fue_forecast['MONTH'].iloc[1:].dt.strftime('%y.%m'))
+            ax3.plot(month_labels, licensed_forecast['ACTIVE_FUE'], color='#ADD8E6', linewidth=1, label='Licensed (expiry)')
+            ax3.plot(month_labels, fue_forecast['ACTIVE_FUE'], color='#007BFF', marker='o', markersize=2, label='In use (30-day logon)')
+            ax3.axhline(total_license_capacity, color='#FFA500', linestyle='--', linewidth=1, label='Capacity')
+            ax3.set_ylim(0, max(total_license_capacity, licensed_forecast['ACTIVE_FUE'].max()) * 1.1)
+            ax3.set_xticks(range(0, len(month_labels), 6))
+            ax3.set_ylabel("FUE")
+            ax3.tick_params(labelsize=7)
+            ax3.legend(fontsize=6, loc='lower left')
+            st.pyplot(fig3, use_container_width=True)
+        else:
+            st.markdown("No data for capacity forecast.")
         st.markdown('</div>', unsafe_allow_html=True)
 
 # Widget 3: My Account (2x1 size) - Placed in the first row
@@ -387,215 +384,6 @@ with cols_overview_row1[2]:
 # FUE License Section (Order change and size/position adjustment)
 st.markdown('<div class="section-title">FUE License</div>', unsafe_allow_html=True)
 
-# CSV file data loading and preprocessing for user_count
-df_users = pd.DataFrame() # Initialize as empty DataFrame
-user_count = 0
-inactive_users_count = 0
-recent_users_data = []
-
-# Initialize two separate dictionaries for license counts
-calculated_fue_license_counts = {} # For FUE License section calculations
-raw_user_license_counts = {}     # For User section's User License Type widget
-
-try:
-    df_users = pd.read_csv('zalmt0020.csv', encoding='euc-kr') # Use euc-kr encoding
-    
-    # Clean USERID for accurate unique count
-    if 'USERID' in df_users.columns:
-        df_users['USERID'] = df_users['USERID'].astype(str).str.strip()
-        user_count = df_users['USERID'].nunique()
-    else:
-        st.warning("No 'USERID' column in zalmt0020.csv. Using default value 902 for Total User Count.")
-        user_count = 902 
-
-    # Get raw counts from the CSV's ROLETYPID column for User section
-    df_users['CLEANED_ROLETYPID'] = df_users['ROLETYPID'].astype(str).str.strip()
-    
-    raw_advanced_count_user_section = df_users[df_users['CLEANED_ROLETYPID'] == 'GB Advanced Use']['USERID'].nunique()
-    raw_core_count_user_section = df_users[df_users['CLEANED_ROLETYPID'] == 'GC Core Use']['USERID'].nunique()
-    raw_self_service_count_user_section = df_users[df_users['CLEANED_ROLETYPID'] == 'GD Self-Service Use']['USERID'].nunique()
-    raw_not_classified_count_user_section = df_users[df_users['CLEANED_ROLETYPID'] == 'Not classified']['USERID'].nunique()
-
-    raw_user_license_counts = {
-        'Advanced': raw_advanced_count_user_section,
-        'Core': raw_core_count_user_section,
-        'Self Service': raw_self_service_count_user_section,
-        'Not Classified': raw_not_classified_count_user_section
-    }
-
-    # Calculate license_type_counts based on new formulas for FUE License section
-    # Use the raw counts from the CSV for the base of these calculations
-    calculated_advanced_fue = raw_advanced_count_user_section * 1
-    calculated_core_fue = raw_core_count_user_section // 5
-    calculated_self_service_fue = raw_self_service_count_user_section // 30
-    calculated_not_classified_fue = 0 # As per user's explicit request
-
-    calculated_fue_license_counts = {
-        'Advanced': calculated_advanced_fue,
-        'Core': calculated_core_fue,
-        'Self Service': calculated_self_service_fue,
-        'Not Classified': calculated_not_classified_fue
-    }
-
-    # (1) Active License - Sum of calculated values for FUE section
-    active_license_count = sum(calculated_fue_license_counts.values())
-    
-    # (2) Remaining License - Total License (500) - Active License
-    total_license_capacity = 500 # Assuming total capacity is 500
-    remaining_license_count = total_license_capacity - active_license_count
-
-    # (3) License Utilization Rate - Active License / Total License
-    license_utilization_rate = (active_license_count / total_license_capacity) * 100 if total_license_capacity > 0 else 0
-
-
-    # (2) Inactive Users - Count users whose LASTLOGONDATE is older than 30 days from today
-    if 'LASTLOGONDATE' in df_users.columns and 'LASTLOGONTIME' in df_users.columns:
-        today = datetime.now()
-        thirty_days_ago = today - timedelta(days=30)
-        
-        # Parse LASTLOGONDATE and LASTLOGONTIME
-        df_users['LAST_LOGON_DATETIME'] = df_users.apply(
-            lambda row: parse_full_datetime(row['LASTLOGONDATE'], row['LASTLOGONTIME']), axis=1
-        )
-        
-        # Count inactive users (last logon older than 30 days)
-        inactive_users_df = df_users[
-            (df_users['LAST_LOGON_DATETIME'].notna()) & 
-            (df_users['LAST_LOGON_DATETIME'] < thirty_days_ago)
-        ]
-        inactive_users_count = inactive_users_df['USERID'].nunique()
-    else:
-        st.warning("Missing 'LASTLOGONDATE' or 'LASTLOGONTIME' columns for Inactive Users calculation. Using default value 19.")
-        inactive_users_count = 19 # Default if columns are missing
-
-    # (3) Recent User Activity - Top 5 users whose EXPIRATIONENDDATE has passed, or are Inactive, or have EXPIRATIONSTARTDATE
-    if 'EXPIRATIONENDDATE' in df_users.columns and 'EXPIRATIONSTARTDATE' in df_users.columns and 'LASTLOGONDATE' in df_users.columns and 'LASTLOGONTIME' in df_users.columns and 'LASTNAME' in df_users.columns and 'FIRSTNAME' in df_users.columns and 'ROLETYPID' in df_users.columns:
-        
-        # Filter users based on conditions
-        df_users['EXPIRY_END_DATETIME'] = df_users['EXPIRATIONENDDATE'].apply(parse_ymd_or_ym_date)
-        df_users['EXPIRY_START_DATETIME'] = df_users['EXPIRATIONSTARTDATE'].apply(parse_ymd_or_ym_date)
-
-        # Condition 1: EXPIRATIONENDDATE is in the past
-        cond_expired = (df_users['EXPIRY_END_DATETIME'].notna()) & (df_users['EXPIRY_END_DATETIME'] < today)
-
-        # Condition 2: User is "Inactive" (last logon older than 30 days)
-        cond_inactive_by_logon = (df_users['LAST_LOGON_DATETIME'].notna()) & (df_users['LAST_LOGON_DATETIME'] < today - timedelta(days=30))
-
-        # Condition 3: EXPIRATIONSTARTDATE exists
-        cond_has_start_date = df_users['EXPIRY_START_DATETIME'].notna()
-        
-        # Combine unique USERIDs from all conditions
-        # Ensure we only consider unique users for the recent activity list
-        relevant_users_df = df_users[cond_expired | cond_inactive_by_logon | cond_has_start_date].copy()
-        
-        # Sort by LAST_LOGON_DATETIME (descending) and take top 5 unique users
-        # Fill NA datetimes with a very old date so they sort last if no logon date
-        relevant_users_df['LAST_LOGON_DATETIME_SORT'] = relevant_users_df['LAST_LOGON_DATETIME'].fillna(datetime(1900, 1, 1))
-        relevant_users_df.sort_values(by='LAST_LOGON_DATETIME_SORT', ascending=False, inplace=True)
-        
-        # Get top 5 unique users based on USERID
-        recent_unique_users = relevant_users_df.drop_duplicates(subset=['USERID']).head(5)
-
-        # Prepare data for display
-        recent_users_data = [] # Clear previous data
-        for index, row in recent_unique_users.iterrows():
-            name_part = str(row['LASTNAME']).strip()
-            first_name_part = str(row['FIRSTNAME']).strip()
-            full_name = f"{name_part}{first_name_part}" if name_part and first_name_part else name_part or first_name_part or row['USERID']
-            
-            status_text, expiry_display = get_user_status_for_recent_activity(row)
-            
-            recent_users_data.append((full_name, row['ROLETYPID'], expiry_display, status_text)) # Use ROLETYPID for grade
-    else:
-        st.warning("Missing columns for Recent User Activity calculation. Using hardcoded data.")
-        recent_users_data = [
-            ("Kim Hwi-young", "GB Advanced User", "Expires 9999.12.30", "Active"),
-            ("Lee Min", "GB Advanced User", "Expires 9999.12.30", "Active"),
-            ("Jung Ha-na", "GB Core User", "Expires 2026.11.03", "Expiring"),
-            ("Park Soo-bin", "GB Self Service", "Expires 2024.08.10", "Inactive"),
-            ("Yoon Tae", "GB Advanced User", "Expires 9999.12.30", "Active")
-        ]
-
-except FileNotFoundError:
-    st.error("zalmt0020.csv file not found. Using default values for some widgets.")
-    user_count = 902
-    inactive_users_count = 19
-    recent_users_data = [
-        ("Kim Hwi-young", "GB Advanced User", "Expires 9999.12.30", "Active"),
-        ("Lee Min", "GB Advanced User", "Expires 9999.12.30", "Active"),
-        ("Jung Ha-na", "GB Core User", "Expires 2026.11.03", "Expiring"),
-        ("Park Soo-bin", "GB Self Service", "Expires 2024.08.10", "Inactive"),
-        ("Yoon Tae", "GB Advanced User", "Expires 9999.12.30", "Active")
-    ]
-    # Default calculated license type counts if file not found
-    raw_advanced_count_user_section = 117 # Assuming 117 users are Advanced if file not found
-    raw_core_count_user_section = 2 # Assuming 2 core users if file not found
-    raw_self_service_count_user_section = 27 # Assuming 27 self-service users if file not found
-    raw_not_classified_count_user_section = 42 # Assuming 42 not classified users if file not found
-    
-    raw_user_license_counts = {
-        'Advanced': raw_advanced_count_user_section,
-        'Core': raw_core_count_user_section,
-        'Self Service': raw_self_service_count_user_section,
-        'Not Classified': raw_not_classified_count_user_section
-    }
-
-    calculated_advanced_fue = raw_advanced_count_user_section * 1
-    calculated_core_fue = raw_core_count_user_section // 5
-    calculated_self_service_fue = raw_self_service_count_user_section // 30
-    calculated_not_classified_fue = 0
-    calculated_fue_license_counts = {
-        'Advanced': calculated_advanced_fue,
-        'Core': calculated_core_fue,
-        'Self Service': calculated_self_service_fue,
-        'Not Classified': calculated_not_classified_fue
-    }
-
-    active_license_count = sum(calculated_fue_license_counts.values())
-    total_license_capacity = 500
-    remaining_license_count = total_license_capacity - active_license_count
-    license_utilization_rate = (active_license_count / total_license_capacity) * 100 if total_license_capacity > 0 else 0
-
-except Exception as e:
-    st.error(f"An error occurred while reading or processing the CSV file: {e}. Using default values for some widgets.")
-    user_count = 902
-    inactive_users_count = 19
-    recent_users_data = [
-        ("Kim Hwi-young", "GB Advanced User", "Expires 9999.12.30", "Active"),
-        ("Lee Min", "GB Advanced User", "Expires 9999.12.30", "Active"),
-        ("Jung Ha-na", "GB Core User", "Expires 2026.11.03", "Expiring"),
-        ("Park Soo-bin", "GB Self Service", "Expires 2024.08.10", "Inactive"),
-        ("Yoon Tae", "GB Advanced User", "Expires 9999.12.30", "Active")
-    ]
-    # Default calculated license type counts if error
-    raw_advanced_count_user_section = 117
-    raw_core_count_user_section = 2
-    raw_self_service_count_user_section = 27
-    raw_not_classified_count_user_section = 42
-    
-    raw_user_license_counts = {
-        'Advanced': raw_advanced_count_user_section,
-        'Core': raw_core_count_user_section,
-        'Self Service': raw_self_service_count_user_section,
-        'Not Classified': raw_not_classified_count_user_section
-    }
-
-    calculated_advanced_fue = raw_advanced_count_user_section * 1
-    calculated_core_fue = raw_core_count_user_section // 5
-    calculated_self_service_fue = raw_self_service_count_user_section // 30
-    calculated_not_classified_fue = 0
-    calculated_fue_license_counts = {
-        'Advanced': calculated_advanced_fue,
-        'Core': calculated_core_fue,
-        'Self Service': calculated_self_service_fue,
-        'Not Classified': calculated_not_classified_fue
-    }
-    active_license_count = sum(calculated_fue_license_counts.values())
-    total_license_capacity = 500
-    remaining_license_count = total_license_capacity - active_license_count
-    license_utilization_rate = (active_license_count / total_license_capacity) * 100 if total_license_capacity > 0 else 0
-
-
 # First row: 5 1x1 widgets (total 5 units) + 1 unit spacing
 cols_fue_row1 = st.columns([1, 1, 1, 1, 1, 1]) # 1+1+1+1+1+1 = 6 units. Last is spacing
 
@@ -730,6 +518,9 @@ with col_left_widgets:
         with st.container(height=180, border=True): # 1x1 ratio (width:height = 1:1)
             st.markdown('<div class="widget-title">Inactive Users</div>', unsafe_allow_html=True)
             st.markdown('<div class="widget-content">', unsafe_allow_html=True)
+            # Binary search on the snapshot's sorted logon index, so moving the slider never rescans the users
+            inactive_days = st.slider("No logon for (days)", 1, 365, INACTIVE_AFTER_DAYS, key='inactive_days')
+            inactive_users_count = len(license_snapshot['date_index'].inactive_rows(inactive_days)) # One row per USERID
             st.markdown(f'<div class="big-number">{inactive_users_count}</div>', unsafe_allow_html=True) # Display calculated value
             st.markdown('</div>', unsafe_allow_html=True)
 
@@ -771,3 +562,9 @@ with col_right_recent_activity:
                 </div>
             """, unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
+
+# Data Quality Section
+st.markdown('<div class="section-title">Data Quality</div>', unsafe_allow_html=True)
+cols_quality = st.columns([3, 3])
+with cols_quality[0]:
+    render_data_quality(license_metrics['quality'])
@@ -0,0 +1,192 @@
+import os
+
+import pandas as pd
+
+from zalmt_loader import LICENSE_TYPES, iter_csv_chunks, new_ingest_report, parse_ymd_or_ym_series
+
+MAX_SAMPLES_PER_CHECK = 20 # Row-level diagnostics kept per (file, check); counts are always complete
+
+# Declared schemas. Missing required columns stop validation before any row is aggregated.
+ZALMT0020_SCHEMA = {
+    'name': 'zalmt0020',
+    'key_column': 'USERID',
+    'required': ['USERID', 'ZDATE', 'LASTLOGONDATE', 'LASTLOGONTIME', 'EXPIRATIONSTARTDATE',
+                 'EXPIRATIONENDDATE', 'ASSIGNEDROLE', 'ROLETYPID'],
+    'categories': {'ROLETYPID': set(LICENSE_TYPES)},
+}
+ZALMT0030_SCHEMA = {
+    'name': 'zalmt0030',
+    'key_column': 'ROLE',
+    'required': ['ROLE', 'TRANSACTIONCODE', 'ZDATE', 'TYPID', 'ROLETYPID'],
+    'categories': {'TYPID': set(LICENSE_TYPES), 'ROLETYPID': set(LICENSE_TYPES)},
+}
+
+class DataValidationError(Exception):
+    """Raised when an export fails validation; carries the data-quality report."""
+
+    def __init__(self, report):
+        self.report = report
+        failed = [f"{item['file']}.{item['check']} ({item['count']})" for item in report['summary'] if item['severity'] == 'error']
+        super().__init__("Data validation failed: " + ", ".join(failed))
+
+def new_quality_report():
+    """Creates the data-quality report dict filled in by DataQualityValidator."""
+    return {'passed': True, 'rows_checked': {}, 'summary': [], 'issues': []}
+
+class DataQualityValidator:
+    """Vectorized schema and consistency checks for zalmt0030 and typed zalmt0020 chunks.
+
+    Checks run on each chunk before it is aggregated. Error-level findings
+    raise DataValidationError at the end of that chunk, so a bad export
+    fails with row-level diagnostics instead of producing license numbers.
+    """
+
+    def __init__(self):
+        self.report = new_quality_report()
+        self.roles = None # ROLE values from zalmt0030, None if it was not validated
+        self._summary_index = {}
+        self._sampled = {}
+        self._seen_user_keys = set()
+        self._checked_columns = set()
+
+    def _add_issues(self, schema, check, severity, mask, chunk, column, message):
+        """Counts the rows selected by mask and samples a few of them for the report."""
+        count = int(mask.sum())
+        if not count:
+            return
+        file_name = schema['name']
+        key = (file_name, check)
+        if key not in self._summary_index:
+            self._summary_index[key] = {'file': file_name, 'check': check, 'severity': severity, 'count': 0, 'message': message}
+            self.report['summary'].append(self._summary_index[key])
+        summary = self._summary_index[key]
+        positions = mask.to_numpy().nonzero()[0][:MAX_SAMPLES_PER_CHECK - self._sampled.get(key, 0)]
+        self._sampled[key] = self._sampled.get(key, 0) + len(positions)
+        for pos in positions:
+            value = chunk[column].iloc[pos] if column in chunk.columns else None
+            row_key = chunk[schema['key_column']].iloc[pos]
+            self.report['issues'].append({
+                'file': file_name,
+                'check': check,
+                'severity': severity,
+                'line': int(chunk['SOURCE_LINE'].iloc[pos]), # Physical line in the file, header is line 1
+                'key': None if pd.isna(row_key) else str(row_key), # NaN is not valid JSON
+                'column': column,
+                'value': None if pd.isna(value) else str(value),
+            })
+        summary['count'] += count
+        if severity == 'error':
+            self.report['passed'] = False
+
+    def _add_file_issue(self, schema, check, severity, message, count=1):
+        """Adds a summary entry for a finding about the whole file rather than its rows."""
+        self.report['summary'].append({'file': schema['name'], 'check': check, 'severity': severity, 'count': count, 'message': message})
+        if severity == 'error':
+            self.report['passed'] = False
+
+    def _check_required(self, schema, columns):
+        if schema['name'] in self._checked_columns:
+            return
+        self._checked_columns.add(schema['name'])
+        missing = [col for col in schema['required'] if col not in columns]
+        if missing:
+            self._add_file_issue(schema, 'missing_columns', 'error', f"Required columns missing: {', '.join(missing)}", count=len(missing))
+            raise DataValidationError(self.report)
+
+    def _check_categories(self, schema, chunk):
+        for column, allowed in schema['categories'].items():
+            values = chunk[column].str.strip()
+            self._add_issues(schema, f'unknown_{column.lower()}', 'error', values.notna() & ~values.isin(allowed), chunk, column,
+                             f"{column} is not one of: {', '.join(sorted(allowed))}")
+
+    def _check_zdate(self, schema, chunk):
+        zdate = chunk['ZDATE']
+        self._add_issues(schema, 'missing_zdate', 'warning', zdate.isna(), chunk, 'ZDATE', "ZDATE is empty")
+        self._add_issues(schema, 'unparseable_zdate', 'warning', zdate.notna() & parse_ymd_or_ym_series(zdate).isna(), chunk, 'ZDATE',
+                         "ZDATE is not YYYYMM or YYYYMMDD")
+
+    def _finish_chunk(self, schema, chunk):
+        rows_checked = self.report['rows_checked']
+        rows_checked[schema['name']] = rows_checked.get(schema['name'], 0) + len(chunk)
+        if not self.report['passed']:
+            raise DataValidationError(self.report)
+
+    def validate_roles_file(self, path='zalmt0030.csv'):
+        """Streams and checks zalmt0030, keeping its ROLE values for the zalmt0020 cross-check."""
+        schema = ZALMT0030_SCHEMA
+        if not os.path.exists(path):
+            self._add_file_issue(schema, 'file_missing', 'warning', f"{path} not found; ASSIGNEDROLE references are not checked")
+            return
+        ingest = new_ingest_report(path)
+        roles = set()
+        for chunk in iter_csv_chunks(path, report=ingest):
+            self._check_required(schema, chunk.columns)
+            chunk['ROLE'] = chunk['ROLE'].str.strip()
+            self._add_issues(schema, 'missing_role', 'warning', chunk['ROLE'].isna(), chunk, 'ROLE', "ROLE is empty")
+            self._check_zdate(schema, chunk)
+            self._check_categories(schema, chunk)
+            roles.update(chunk['ROLE'].dropna().unique())
+            self._finish_chunk(schema, chunk)
+        if ingest['header'] is not None:
+            self._check_required(schema, ingest['header'])
+        if not ingest['rows_read']:
+            # An empty role list would flag every named ASSIGNEDROLE; skip the cross-check as for a missing file
+            self._add_file_issue(schema, 'empty_export', 'warning', f"{path} has no data rows; ASSIGNEDROLE references are not checked")
+            return
+        self.roles = roles
+
+    def check_user_chunk(self, chunk):
+        """Checks one typed zalmt0020 chunk (see zalmt_loader.type_user_chunk) before it is aggregated."""
+        schema = ZALMT0020_SCHEMA
+        self._check_required(schema, chunk.columns)
+
+        has_userid = chunk['USERID'].notna()
+        self._add_issues(schema, 'missing_userid', 'error', ~has_userid, chunk, 'USERID', "USERID is empty")
+
+        # Duplicate USERIDs per ZDATE, within this chunk or against earlier chunks (empty USERIDs are reported above)
+        keys = chunk['ZDATE'].fillna('') + '|' + chunk['USERID']
+        duplicated = has_userid & (keys.duplicated() | keys.isin(self._seen_user_keys))
+        self._add_issues(schema, 'duplicate_userid', 'error', duplicated, chunk, 'USERID', "USERID appears more than once for the same ZDATE")
+        self._seen_user_keys.update(keys[has_userid].unique())
+
+        self._check_zdate(schema, chunk)
+        self._add_issues(schema, 'unparseable_logon', 'warning',
+                         chunk['LASTLOGONDATE'].notna() & chunk['LAST_LOGON_DATETIME'].isna(), chunk, 'LASTLOGONDATE',
+                         "LASTLOGONDATE/LASTLOGONTIME could not be parsed as a date and time")
+        self._add_issues(schema, 'unparseable_expiration_start', 'warning',
+                         chunk['EXPIRATIONSTARTDATE'].notna() & chunk['EXPIRY_START_DATETIME'].isna(), chunk, 'EXPIRATIONSTARTDATE',
+                         "EXPIRATIONSTARTDATE could not be parsed as a date")
+        self._add_issues(schema, 'unparseable_expiration_end', 'warning',
+                         chunk['EXPIRATIONENDDATE'].notna() & chunk['EXPIRY_END_DATETIME'].isna() & ~chunk['EXPIRY_NEVER'], chunk, 'EXPIRATIONENDDATE',
+                         "EXPIRATIONENDDATE could not be parsed as a date")
+
+        self._add_issues(schema, 'missing_roletypid', 'warning', chunk['ROLETYPID'].isna(), chunk, 'ROLETYPID',
+                         "ROLETYPID is empty; the user is not counted toward any license type")
+        self._check_categories(schema, chunk)
+
+        # ASSIGNEDROLE holds a role count in current exports; non-numeric values are role names (';'-separated)
+        if self.roles is not None:
+            assigned = chunk['ASSIGNEDROLE'].str.strip()
+            named = assigned[assigned.notna() & ~assigned.str.fullmatch(r'\d+', na=False)]
+            if not named.empty:
+                references = named.str.split(';').explode().str.strip()
+                unknown = references[references.ne('') & ~references.isin(self.roles)]
+                mask = chunk.index.isin(unknown.index)
+                self._add_issues(schema, 'unknown_assigned_role', 'error', pd.Series(mask, index=chunk.index), chunk, 'ASSIGNEDROLE',
+                                 "ASSIGNEDROLE references a role missing from zalmt0030")
+
+        self._finish_chunk(schema, chunk)
+
+    def finish_user_file(self, ingest_report):
+        """Checks zalmt0020 as a whole once streaming ends (see iter_csv_chunks' ingest report).
+
+        Catches what no chunk can: a header without the required columns
+        and an export with no data rows, which would otherwise render as
+        zero users and zero FUE.
+        """
+        schema = ZALMT0020_SCHEMA
+        if ingest_report['header'] is not None:
+            self._check_required(schema, ingest_report['header'])
+        if not ingest_report['rows_read']:
+            self._add_file_issue(schema, 'empty_export', 'error', f"{ingest_report['path']} has no data rows")
+            raise DataValidationError(self.report)
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+NAT_INT64 = np.iinfo(np.int64).min # datetime64[ns] NaT viewed as int64
+
+def _to_int64(t):
+    return pd.Timestamp(t).value # Always nanoseconds since the epoch
+
+class SortedDateIndex:
+    """One datetime column as a sorted int64 array plus the row permutation that sorts it.
+
+    Rows with NaT are left out, so they never match a range query (the same
+    as NaT comparing False in a boolean mask). Queries are binary searches
+    returning positional row numbers into the frame the index was built from.
+    """
+
+    def __init__(self, values):
+        ns = pd.Series(values).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        rows = np.flatnonzero(ns != NAT_INT64)
+        order = np.argsort(ns[rows], kind='stable')
+        self.values = ns[rows][order]
+        self.rows = rows[order]
+
+    def __len__(self):
+        return len(self.values)
+
+    def position_slice(self, start=None, end=None):
+        """Slice into self.values/self.rows for start <= value < end (either bound may be None)."""
+        lo = 0 if start is None else np.searchsorted(self.values, _to_int64(start), side='left')
+        hi = len(self.values) if end is None else np.searchsorted(self.values, _to_int64(end), side='left')
+        return slice(lo, max(lo, hi))
+
+    def rows_between(self, start=None, end=None):
+        """Row numbers with start <= value < end, in date order."""
+        return self.rows[self.position_slice(start, end)]
+
+    def count_between(self, start=None, end=None):
+        s = self.position_slice(start, end)
+        return s.stop - s.start
+
+    def rows_before(self, t):
+        return self.rows_between(end=t)
+
+    def rows_on_or_after(self, t):
+        return self.rows_between(start=t)
+
+class UserDateIndex:
+    """Sorted indexes over LAST_LOGON_DATETIME and EXPIRY_END_DATETIME of the per-user status frame.
+
+    Expiry dates of 99991230 ("never expires") are NaT in the frame and so
+    are never expired or expiring.
+    """
+
+    def __init__(self, users):
+        self.logon = SortedDateIndex(users['LAST_LOGON_DATETIME'])
+        self.expiry = SortedDateIndex(users['EXPIRY_END_DATETIME'])
+
+    def inactive_rows(self, days, today=None):
+        """Users whose last logon is more than `days` days before today."""
+        today = today or datetime.now()
+        return self.logon.rows_before(today - timedelta(days=days))
+
+    def expired_rows(self, today=None):
+        today = today or datetime.now()
+        return self.expiry.rows_before(today)
+
+    def expiring_rows(self, days, today=None):
+        """Users whose expiry date falls within the next `days` days."""
+        today = today or datetime.now()
+        return self.expiry.rows_between(today, today + timedelta(days=days))
+
+    def logged_on_rows(self, start=None, end=None):
+        """Users whose last logon is in [start, end)."""
+        return self.logon.rows_between(start, end)
@@ -0,0 +1,224 @@
+"""Local JSON API serving the same license metrics the dashboard renders.
+
+Run with `python license_api.py` (or `uvicorn license_api:app`). Every
+response carries an ETag derived from the snapshot fingerprint, so clients
+polling with If-None-Match get a 304 without the export being re-read.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from data_quality import DataValidationError
+from license_forecast import DEFAULT_FORECAST_MONTHS, get_snapshot_forecast
+from license_metrics import get_license_snapshot, snapshot_fingerprint
+
+USERS_CSV = os.environ.get('ALMS_USERS_CSV', 'zalmt0020.csv')
+ROLES_CSV = os.environ.get('ALMS_ROLES_CSV', 'zalmt0030.csv')
+METRIC_KEYS = [
+    'user_count', 'inactive_users_count', 'active_license_count', 'total_license_capacity',
+    'remaining_license_count', 'license_utilization_rate', 'raw_user_license_counts',
+    'calculated_fue_license_counts', 'warnings', 'ingest', 'quality',
+]
+MAX_FILTER_DAYS = 36500 # Upper bound for inactive_days/expiring_within_days, keeps today +/- N days in datetime64 range
+
+def _etag(fingerprint):
+    return f'"{fingerprint}"'
+
+def _etag_matches(request, etag):
+    """True if the request's If-None-Match lists etag (weak comparison, as RFC 9110 requires for If-None-Match)."""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+# Per-snapshot API state, keyed by name: (fingerprint, value). Holds the serializable user frame and the
+# rendered bodies of unfiltered responses, so between exports those are built once and then only copied out.
+_api_cache = {}
+
+def _per_snapshot(name, snapshot, make):
+    """Returns make(snapshot), computed once per snapshot fingerprint."""
+    cached = _api_cache.get(name)
+    if cached is None or cached[0] != snapshot['fingerprint']:
+        cached = (snapshot['fingerprint'], make(snapshot))
+        _api_cache[name] = cached
+    return cached[1]
+
+def _prepare_user_records(snapshot):
+    """Converts the snapshot's user frame to JSON-ready columns (NaN/NaT as None), row-aligned with its date index."""
+    users = snapshot['users']
+    records = pd.DataFrame({
+        'userid': users['USERID'],
+        'name': users['NAME'],
+        'license_type': users['LICENSE_TYPE'],
+        'status': users['STATUS'],
+        'expiration_end_date': pd.to_datetime(users['EXPIRY_END_DATETIME']).dt.strftime('%Y-%m-%d'),
+        'never_expires': users['EXPIRY_NEVER'].astype(bool),
+        'last_logon': pd.to_datetime(users['LAST_LOGON_DATETIME']).dt.strftime('%Y-%m-%dT%H:%M:%S'),
+    })
+    return records.astype(object).where(records.notna(), None)
+
+def _user_records(snapshot):
+    return _per_snapshot('user_records', snapshot, _prepare_user_records)
+
+def _render(build, snapshot):
+    """Builds and serializes one response body; runs in the threadpool."""
+    body = build(snapshot)
+    if body is None:
+        return None
+    body['fingerprint'] = snapshot['fingerprint']
+    return JSONResponse(body).body
+
+def _export_missing(error):
+    """503 for a missing users export: the service has nothing to serve until the file is (re)written."""
+    path = error.filename or USERS_CSV
+    return JSONResponse({'error': f"{path} not found", 'path': path}, status_code=503, headers={'Cache-Control': 'no-cache'})
+
+async def _cached_json(request, build, cache_name=None):
+    """Answers 304 straight from the fingerprint, otherwise builds the body from the cached snapshot.
+
+    Building and serializing run in the threadpool so a large body never
+    blocks the event loop. With cache_name, the rendered body is reused for
+    every request until the fingerprint changes.
+    """
+    try:
+        fingerprint = snapshot_fingerprint(USERS_CSV, ROLES_CSV)
+    except FileNotFoundError as e:
+        return _export_missing(e)
+    etag = _etag(fingerprint)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        snapshot = await run_in_threadpool(get_license_snapshot, USERS_CSV, ROLES_CSV)
+    except FileNotFoundError as e: # Removed between the stat above and the load
+        return _export_missing(e)
+    except DataValidationError as e:
+        # The failed validation is cached under the same fingerprint, so this ETag stays valid too
+        return JSONResponse({'error': str(e), 'quality': e.report, 'fingerprint': fingerprint}, status_code=422, headers=headers)
+    # The export may have been replaced between the stat and the load; label the body with what was served
+    headers['ETag'] = _etag(snapshot['fingerprint'])
+    if cache_name:
+        content = await run_in_threadpool(_per_snapshot, cache_name, snapshot, lambda snap: _render(build, snap))
+    else:
+        content = await run_in_threadpool(_render, build, snapshot)
+    if content is None:
+        return JSONResponse({'error': 'not found'}, status_code=404, headers=headers)
+    return Response(content, media_type='application/json', headers=headers)
+
+async def metrics(request):
+    """GET /metrics: active FUE, remaining licenses, utilization, inactive users and license-type split."""
+    def build(snapshot):
+        return {key: snapshot['metrics'][key] for key in METRIC_KEYS}
+    return await _cached_json(request, build, cache_name='metrics')
+
+def _parse_user_filters(params):
+    """Reads the date filters of /users; raises ValueError on malformed values."""
+    filters = {}
+    for key in ('inactive_days', 'expiring_within_days'):
+        if key in params:
+            try:
+                filters[key] = int(params[key])
+            except ValueError:
+                filters[key] = -1
+            if not 0 <= filters[key] <= MAX_FILTER_DAYS:
+                raise ValueError(f"{key} must be an integer between 0 and {MAX_FILTER_DAYS}")
+    for key in ('logon_from', 'logon_to'):
+        if key in params:
+            filters[key] = pd.Timestamp(params[key]) # Raises ValueError on unparseable dates
+            if not pd.Timestamp.min <= filters[key] <= pd.Timestamp.max:
+                raise ValueError(f"{key} must be between {pd.Timestamp.min.date()} and {pd.Timestamp.max.date()}")
+    if params.get('expired') in ('1', 'true'):
+        filters['expired'] = True
+    return filters
+
+def _filtered_rows(index, filters):
+    """Intersects the date-index lookups for the requested filters; None means no date filter."""
+    lookups = []
+    if 'inactive_days' in filters:
+        lookups.append(index.inactive_rows(filters['inactive_days']))
+    if 'expiring_within_days' in filters:
+        lookups.append(index.expiring_rows(filters['expiring_within_days']))
+    if filters.get('expired'):
+        lookups.append(index.expired_rows())
+    if 'logon_from' in filters or 'logon_to' in filters:
+        lookups.append(index.logged_on_rows(filters.get('logon_from'), filters.get('logon_to')))
+    if not lookups:
+        return None
+    rows = np.sort(lookups[0])
+    for found in lookups[1:]:
+        rows = np.intersect1d(rows, found, assume_unique=True)
+    return rows
+
+async def users(request):
+    """GET /users: per-user status.
+
+    Optional filters: status=Active|Expiring|Inactive, inactive_days=N,
+    expiring_within_days=N, expired=true, logon_from/logon_to=YYYY-MM-DD
+    (half-open range). Date filters are answered from the snapshot's
+    sorted date index.
+    """
+    status = request.query_params.get('status')
+    try:
+        filters = _parse_user_filters(request.query_params)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    def build(snapshot):
+        records = _user_records(snapshot)
+        rows = _filtered_rows(snapshot['date_index'], filters)
+        if rows is not None:
+            records = records.iloc[rows]
+        if status:
+            records = records[records['status'] == status]
+        return {'users': records.to_dict(orient='records')}
+    return await _cached_json(request, build, cache_name=None if status or filters else 'users')
+
+async def user_detail(request):
+    """GET /users/{userid}: status of one user."""
+    userid = request.path_params['userid']
+    def build(snapshot):
+        records = _user_records(snapshot)
+        match = records[records['userid'] == userid]
+        if match.empty:
+            return None
+        return {'user': match.iloc[0].to_dict()}
+    return await _cached_json(request, build)
+
+async def forecast(request):
+    """GET /forecast[?months=N][&basis=licensed]: projected active FUE today and per month.
+
+    By default users also drop out 30 days after their last logon; basis=licensed projects expiry only.
+    """
+    try:
+        months = int(request.query_params.get('months', DEFAULT_FORECAST_MONTHS))
+    except ValueError:
+        months = 0
+    if not 1 <= months <= 120:
+        return JSONResponse({'error': 'months must be an integer between 1 and 120'}, status_code=400)
+    def build(snapshot):
+        if request.query_params.get('basis') == 'licensed':
+            projection = get_snapshot_forecast(snapshot, months=months, inactive_after_days=None)
+        else:
+            projection = get_snapshot_forecast(snapshot, months=months)
+        projection = projection.assign(MONTH=projection['MONTH'].dt.strftime('%Y-%m-%d')) # Row 0 is today, then month starts
+        return {'forecast': projection.to_dict(orient='records')}
+    return await _cached_json(request, build)
+
+app = Starlette(routes=[
+    Route('/metrics', metrics),
+    Route('/users', users),
+    Route('/users/{userid}', user_detail),
+    Route('/forecast', forecast),
+])
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='127.0.0.1', port=int(os.environ.get('ALMS_API_PORT', '8502')))
@@ -0,0 +1,79 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from license_metrics import FUE_USERS_PER_LICENSE, INACTIVE_AFTER_DAYS, LICENSE_TYPES, TOTAL_LICENSE_CAPACITY
+
+DEFAULT_FORECAST_MONTHS = 24
+
+def forecast_active_fue(users, months=DEFAULT_FORECAST_MONTHS, today=None, inactive_after_days=INACTIVE_AFTER_DAYS,
+                        total_license_capacity=TOTAL_LICENSE_CAPACITY):
+    """Projects active FUE today (row 0) and on the first day of each of the next `months` months.
+
+    `users` is the per-user status frame from the license snapshot. A user
+    stops counting at the earlier of their EXPIRATIONENDDATE and their last
+    logon plus `inactive_after_days`, assuming no further logons; 99991230
+    and empty expiry dates never expire, and users who never logged on have
+    no inactivity date. Pass inactive_after_days=None to project expiry only.
+    Row 0 applies the same rule today, so it counts fewer users than
+    active_license_count, which includes every classified user.
+
+    Each user's gone-by date is bucketed into a month offset, counted per
+    license type with np.bincount and turned into "gone by month k" with a
+    single cumulative sum, so the cost is one pass over the users
+    regardless of the horizon.
+    """
+    today = pd.Timestamp(today or datetime.now())
+    current_month = np.datetime64(today.to_period('M').start_time, 'M')
+    month_starts = pd.date_range(today.to_period('M').start_time, periods=months + 1, freq='MS')[1:]
+
+    expiry = users['EXPIRY_END_DATETIME'].to_numpy(dtype='datetime64[ns]').copy()
+    expiry[users['EXPIRY_NEVER'].to_numpy(dtype=bool)] = np.datetime64('NaT')
+    gone_at = expiry
+    if inactive_after_days is not None:
+        logon = users['LAST_LOGON_DATETIME'].to_numpy(dtype='datetime64[ns]')
+        inactive_from = logon + np.timedelta64(inactive_after_days, 'D') # NaT for users who never logged on
+        gone_at = np.fmin(expiry, inactive_from) # fmin ignores NaT on either side
+    has_gone_at = ~np.isnat(gone_at)
+
+    # Offset 0 = already gone today; offset j + 1 = gone during month j from now, i.e. no longer counted
+    # on the first day of month j + 1; months + 1 = beyond the horizon
+    offsets = np.full(len(users), months + 1, dtype=np.int64)
+    gone_month = gone_at[has_gone_at].astype('datetime64[M]')
+    offsets[has_gone_at] = np.clip((gone_month - current_month).astype(np.int64) + 1, 1, months + 1)
+    offsets[has_gone_at & (gone_at < today.to_datetime64())] = 0
+
+    license_types = users['LICENSE_TYPE'].to_numpy()
+    projection = {'MONTH': pd.DatetimeIndex([today.normalize()]).append(month_starts)}
+    active_fue = np.zeros(months + 1, dtype=np.int64)
+    for roletypid, label in LICENSE_TYPES.items():
+        type_offsets = offsets[license_types == roletypid]
+        gone_by = np.cumsum(np.bincount(type_offsets, minlength=months + 2))[:months + 1]
+        active_users = len(type_offsets) - gone_by
+        divisor = FUE_USERS_PER_LICENSE[label]
+        fue = active_users // divisor if divisor else np.zeros(months + 1, dtype=np.int64)
+        projection[label] = fue
+        active_fue += fue
+
+    projection['ACTIVE_FUE'] = active_fue
+    projection['REMAINING'] = total_license_capacity - active_fue
+    return pd.DataFrame(projection)
+
+# Projections per (months, inactive_after_days): (fingerprint, projection), shared by the dashboard and the HTTP API
+_forecast_cache = {}
+_forecast_lock = threading.Lock()
+
+def get_snapshot_forecast(snapshot, months=DEFAULT_FORECAST_MONTHS, inactive_after_days=INACTIVE_AFTER_DAYS):
+    """Returns forecast_active_fue for a license snapshot's users, computed once per snapshot fingerprint.
+
+    The returned frame is shared between callers; copy it before modifying it.
+    """
+    key = (months, inactive_after_days)
+    with _forecast_lock:
+        cached = _forecast_cache.get(key)
+        if cached is None or cached[0] != snapshot['fingerprint']:
+            cached = (snapshot['fingerprint'], forecast_active_fue(snapshot['users'], months=months, inactive_after_days=inactive_after_days))
+            _forecast_cache[key] = cached
+    return cached[1]
@@ -0,0 +1,204 @@
+import hashlib
+import os
+import threading
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from data_quality import DataQualityValidator, DataValidationError
+from date_index import UserDateIndex
+from zalmt_loader import DEFAULT_CHUNKSIZE, LICENSE_TYPES, iter_user_chunks, new_ingest_report
+
+LICENSE_LABELS = list(LICENSE_TYPES.values())
+# Users per FUE for each license type (0 means the type does not consume FUE)
+FUE_USERS_PER_LICENSE = {'Advanced': 1, 'Core': 5, 'Self Service': 30, 'Not Classified': 0}
+TOTAL_LICENSE_CAPACITY = 500
+INACTIVE_AFTER_DAYS = 30
+EXPIRING_WITHIN_DAYS = 90
+RECENT_ACTIVITY_LIMIT = 5
+USER_COLUMNS = ['USERID', 'NAME', 'LICENSE_TYPE', 'EXPIRY_START_DATETIME', 'EXPIRY_END_DATETIME', 'EXPIRY_NEVER', 'LAST_LOGON_DATETIME']
+
+def calculate_fue(raw_user_license_counts):
+    """Converts per-type user counts into FUE (Advanced 1:1, Core 5:1, Self Service 30:1, Not Classified 0)."""
+    return {
+        label: count // FUE_USERS_PER_LICENSE[label] if FUE_USERS_PER_LICENSE[label] else 0
+        for label, count in raw_user_license_counts.items()
+    }
+
+def user_frame(chunk):
+    """Narrows a typed chunk to the per-user columns kept in the snapshot (missing date columns become NaT)."""
+    name = pd.Series('', index=chunk.index)
+    for column in ('LASTNAME', 'FIRSTNAME'):
+        if column in chunk.columns:
+            name = name + chunk[column].fillna('').astype(str).str.strip()
+
+    frame = pd.DataFrame({
+        'USERID': chunk['USERID'],
+        'NAME': name.where(name != '', chunk['USERID']),
+        'LICENSE_TYPE': chunk['CLEANED_ROLETYPID'] if 'CLEANED_ROLETYPID' in chunk.columns else np.nan,
+        'EXPIRY_NEVER': chunk['EXPIRY_NEVER'] if 'EXPIRY_NEVER' in chunk.columns else False,
+    }, index=chunk.index)
+    for column in ('EXPIRY_START_DATETIME', 'EXPIRY_END_DATETIME', 'LAST_LOGON_DATETIME'):
+        frame[column] = chunk[column] if column in chunk.columns else pd.NaT
+    return frame[USER_COLUMNS]
+
+def user_status_series(users, date_index, today):
+    """Active/Expiring/Inactive per user, answered from the date index (expired or 30+ days without logon is Inactive)."""
+    status = np.full(len(users), 'Active', dtype=object)
+    status[date_index.expiring_rows(EXPIRING_WITHIN_DAYS, today)] = 'Expiring' # Expiring within 90 days
+    status[date_index.inactive_rows(INACTIVE_AFTER_DAYS, today)] = 'Inactive' # No recent login for 30+ days
+    status[date_index.expired_rows(today)] = 'Inactive' # Expired
+    return pd.Series(status, index=users.index)
+
+def recent_user_activity(users, date_index, today, limit=RECENT_ACTIVITY_LIMIT):
+    """Top users that are expired, inactive or have an EXPIRATIONSTARTDATE, most recent logon first."""
+    relevant = np.union1d(date_index.expired_rows(today), date_index.inactive_rows(INACTIVE_AFTER_DAYS, today))
+    relevant = np.union1d(relevant, np.flatnonzero(users['EXPIRY_START_DATETIME'].notna().to_numpy()))
+    recent = users.iloc[relevant].sort_values('LAST_LOGON_DATETIME', ascending=False, na_position='last', kind='mergesort').head(limit)
+
+    recent_users_data = []
+    for user in recent.itertuples(index=False):
+        # 99991230 ("never expires") and empty expiry dates are NaT
+        expiry_display = f"Expires {user.EXPIRY_END_DATETIME.strftime('%Y.%m.%d')}" if pd.notna(user.EXPIRY_END_DATETIME) else "Expires 9999.12.30"
+        recent_users_data.append((user.NAME, user.LICENSE_TYPE, expiry_display, user.STATUS)) # Use ROLETYPID for grade
+    return recent_users_data
+
+class LicenseMetricsAccumulator:
+    """Folds typed zalmt0020 chunks into the dashboard's user and FUE metrics.
+
+    Between chunks only the distinct USERIDs per license type and a narrow
+    per-user frame are kept, never the raw chunk. Date thresholds (inactive,
+    expired, expiring) are answered afterwards from one UserDateIndex over
+    the per-user frame, so every metric and status uses the same rows.
+    """
+
+    def __init__(self, today=None):
+        self.today = today or datetime.now()
+        self.warnings = []
+        self.user_ids = set()
+        self.license_user_ids = {label: set() for label in LICENSE_LABELS}
+        self.user_frames = []
+        self._checked_columns = False
+
+    def _check_columns(self, chunk):
+        columns = set(chunk.columns)
+        if 'USERID' not in columns:
+            self.warnings.append("No 'USERID' column in zalmt0020.csv. User counts are unavailable.")
+        if 'ROLETYPID' not in columns:
+            self.warnings.append("No 'ROLETYPID' column in zalmt0020.csv. License type counts are unavailable.")
+        if 'LAST_LOGON_DATETIME' not in columns:
+            self.warnings.append("Missing 'LASTLOGONDATE' or 'LASTLOGONTIME' columns for Inactive Users calculation.")
+        if 'EXPIRY_END_DATETIME' not in columns:
+            self.warnings.append("Missing 'EXPIRATIONENDDATE' column for expiry status.")
+        self._checked_columns = True
+
+    def update(self, chunk):
+        """Adds one typed chunk (see zalmt_loader.type_user_chunk)."""
+        if not self._checked_columns:
+            self._check_columns(chunk)
+        if 'USERID' not in chunk.columns:
+            return
+
+        self.user_ids.update(chunk['USERID'].unique())
+
+        if 'CLEANED_ROLETYPID' in chunk.columns:
+            for roletypid, user_ids in chunk.groupby('CLEANED_ROLETYPID', sort=False)['USERID']:
+                label = LICENSE_TYPES.get(roletypid)
+                if label:
+                    self.license_user_ids[label].update(user_ids.unique())
+
+        self.user_frames.append(user_frame(chunk))
+
+    def users(self):
+        """Returns one row per USERID (the last one in the file wins)."""
+        if not self.user_frames:
+            return pd.DataFrame(columns=USER_COLUMNS)
+        users = pd.concat(self.user_frames, ignore_index=True)
+        return users.drop_duplicates(subset=['USERID'], keep='last').reset_index(drop=True)
+
+    def snapshot(self):
+        """Returns {'metrics', 'users', 'date_index'}; metrics is the dict the dashboard renders."""
+        users = self.users()
+        date_index = UserDateIndex(users)
+        users['STATUS'] = user_status_series(users, date_index, self.today)
+
+        raw_user_license_counts = {label: len(self.license_user_ids[label]) for label in LICENSE_LABELS}
+        calculated_fue_license_counts = calculate_fue(raw_user_license_counts)
+        active_license_count = sum(calculated_fue_license_counts.values())
+
+        metrics = {
+            'user_count': len(self.user_ids),
+            'inactive_users_count': len(date_index.inactive_rows(INACTIVE_AFTER_DAYS, self.today)), # One row per USERID
+            'raw_user_license_counts': raw_user_license_counts,
+            'calculated_fue_license_counts': calculated_fue_license_counts,
+            'active_license_count': active_license_count,
+            'total_license_capacity': TOTAL_LICENSE_CAPACITY,
+            'remaining_license_count': TOTAL_LICENSE_CAPACITY - active_license_count,
+            'license_utilization_rate': (active_license_count / TOTAL_LICENSE_CAPACITY) * 100 if TOTAL_LICENSE_CAPACITY > 0 else 0,
+            'recent_users_data': recent_user_activity(users, date_index, self.today),
+            'warnings': list(self.warnings),
+        }
+        return {'metrics': metrics, 'users': users, 'date_index': date_index}
+
+def compute_license_snapshot(path='zalmt0020.csv', roles_path='zalmt0030.csv', chunksize=DEFAULT_CHUNKSIZE, errors='quarantine', today=None):
+    """Validates and streams the exports into {'metrics', 'users', 'date_index'}.
+
+    The ingest and data-quality reports are under metrics['ingest'] and
+    metrics['quality']. Raises DataValidationError, before the offending
+    chunk is aggregated, if validation finds errors.
+    """
+    validator = DataQualityValidator()
+    validator.validate_roles_file(roles_path)
+    report = new_ingest_report(path)
+    accumulator = LicenseMetricsAccumulator(today=today)
+    for chunk in iter_user_chunks(path, chunksize=chunksize, errors=errors, report=report):
+        validator.check_user_chunk(chunk)
+        accumulator.update(chunk)
+    validator.finish_user_file(report)
+    snapshot = accumulator.snapshot()
+    snapshot['metrics']['ingest'] = report
+    snapshot['metrics']['quality'] = validator.report
+    return snapshot
+
+def compute_license_metrics(path='zalmt0020.csv', roles_path='zalmt0030.csv', chunksize=DEFAULT_CHUNKSIZE, errors='quarantine', today=None):
+    """Streams zalmt0020 once and returns the metrics dict with the ingest report under 'ingest'."""
+    return compute_license_snapshot(path, roles_path, chunksize=chunksize, errors=errors, today=today)['metrics']
+
+# Last snapshot per path, shared by the dashboard and the HTTP API within one process
+_snapshot_cache = {}
+_snapshot_lock = threading.Lock()
+
+def snapshot_fingerprint(path='zalmt0020.csv', roles_path='zalmt0030.csv', today=None):
+    """Identifies the exports without reading them: path, size and mtime, plus the day (statuses age with the calendar)."""
+    today = today or date.today()
+    parts = []
+    for file_path in (path, roles_path):
+        if os.path.exists(file_path) or file_path == path: # A missing users export is an error; a missing roles file is not
+            stat = os.stat(file_path)
+            parts.append(f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}")
+        else:
+            parts.append(f"{os.path.abspath(file_path)}|missing")
+    key = "|".join(parts + [today.isoformat()])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+def get_license_snapshot(path='zalmt0020.csv', roles_path='zalmt0030.csv'):
+    """Returns the cached snapshot for path, recomputing only when its fingerprint changes.
+
+    A failed validation is cached the same way (its report, with a fresh
+    DataValidationError raised per call), so an invalid export is not
+    re-parsed on every request until it is replaced.
+    """
+    fingerprint = snapshot_fingerprint(path, roles_path)
+    with _snapshot_lock:
+        snapshot = _snapshot_cache.get(path)
+        if snapshot is None or snapshot['fingerprint'] != fingerprint:
+            try:
+                snapshot = compute_license_snapshot(path, roles_path)
+            except DataValidationError as e:
+                snapshot = {'error_report': e.report}
+            snapshot['fingerprint'] = fingerprint
+            _snapshot_cache[path] = snapshot
+    if 'error_report' in snapshot:
+        raise DataValidationError(snapshot['error_report'])
+    return snapshot
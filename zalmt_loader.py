@@ -0,0 +1,179 @@
+import codecs
+import csv
+
+import pandas as pd
+
+# Encodings seen in SAP ZALMT exports, in order of preference when several decode a file equally well
+CANDIDATE_ENCODINGS = ('utf-8', 'euc-kr', 'cp949')
+DEFAULT_CHUNKSIZE = 50000 # Rows per typed chunk; peak memory scales with this, not with the file size
+MAX_QUARANTINE_SAMPLES = 50 # Line numbers kept in the report for diagnostics
+NEVER_EXPIRES = '99991230' # SAP sentinel for "no expiry"
+# ROLETYPID values and the label each one is shown under
+LICENSE_TYPES = {
+    'GB Advanced Use': 'Advanced',
+    'GC Core Use': 'Core',
+    'GD Self-Service Use': 'Self Service',
+    'Not classified': 'Not Classified',
+}
+
+def detect_encoding(path):
+    """Returns the candidate encoding that fails on the fewest lines of the file (one streaming pass)."""
+    failures = {enc: 0 for enc in CANDIDATE_ENCODINGS}
+    with open(path, 'rb') as f:
+        for raw_line in f:
+            for enc in CANDIDATE_ENCODINGS:
+                try:
+                    raw_line.decode(enc)
+                except UnicodeDecodeError:
+                    failures[enc] += 1
+    # min() keeps the first candidate on ties, so clean ASCII files resolve to utf-8
+    return min(CANDIDATE_ENCODINGS, key=lambda enc: failures[enc])
+
+def new_ingest_report(path):
+    """Creates the dict that iter_csv_chunks fills in while streaming a file."""
+    return {
+        'path': path,
+        'encoding': None,
+        'header': None, # Column names, None if the file is empty
+        'rows_read': 0,
+        'rows_quarantined': 0,
+        'rows_replaced': 0, # Rows decoded with U+FFFD replacement characters
+        'rows_fallback_decoded': 0, # Rows that only decoded with a secondary candidate encoding (mixed exports)
+        'quarantined_lines': [],
+    }
+
+def _record_quarantine(report, line_no):
+    report['rows_quarantined'] += 1
+    if len(report['quarantined_lines']) < MAX_QUARANTINE_SAMPLES:
+        report['quarantined_lines'].append(line_no)
+
+def _iter_decoded_lines(f, encoding, errors, report, position):
+    """Decodes binary lines one at a time, falling back to the other candidates before applying the error policy."""
+    fallbacks = [enc for enc in CANDIDATE_ENCODINGS if enc != encoding]
+    for line_no, raw_line in enumerate(f, start=1):
+        position[0] = line_no
+        if line_no == 1 and raw_line.startswith(codecs.BOM_UTF8):
+            raw_line = raw_line[len(codecs.BOM_UTF8):]
+        try:
+            yield raw_line.decode(encoding)
+            continue
+        except UnicodeDecodeError:
+            pass
+
+        for enc in fallbacks:
+            try:
+                text = raw_line.decode(enc)
+            except UnicodeDecodeError:
+                continue
+            report['rows_fallback_decoded'] += 1
+            yield text
+            break
+        else:
+            if line_no == 1 or errors == 'replace':
+                # The header is never quarantined; losing it would lose every column name
+                report['rows_replaced'] += 1
+                yield raw_line.decode(encoding, errors='replace')
+            else:
+                _record_quarantine(report, line_no)
+
+def iter_csv_chunks(path, chunksize=DEFAULT_CHUNKSIZE, encoding=None, errors='quarantine', report=None):
+    """Streams a CSV file as DataFrame chunks of string columns ('' read as NaN).
+
+    Each chunk also carries SOURCE_LINE, the physical line of the file each
+    row was read from (its last line, for quoted fields spanning lines).
+
+    Lines that no candidate encoding can decode are dropped and counted when
+    errors='quarantine', or decoded with replacement characters when
+    errors='replace'. Rows with the wrong number of fields are always
+    quarantined. Pass a dict from new_ingest_report() to collect the counts.
+    """
+    if errors not in ('quarantine', 'replace'):
+        raise ValueError(f"errors must be 'quarantine' or 'replace', got {errors!r}")
+    if report is None:
+        report = new_ingest_report(path)
+    if encoding is None:
+        encoding = detect_encoding(path)
+    report['encoding'] = encoding
+
+    position = [0] # Physical line number of the last line handed to the csv reader
+    with open(path, 'rb') as f:
+        reader = csv.reader(_iter_decoded_lines(f, encoding, errors, report, position))
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [col.strip() for col in header]
+        report['header'] = header
+
+        rows = []
+        lines = []
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error: # e.g. a stray carriage return inside a field
+                _record_quarantine(report, position[0])
+                continue
+            if not row:
+                continue # Blank line
+            if len(row) != len(header):
+                _record_quarantine(report, position[0])
+                continue
+            rows.append(row)
+            lines.append(position[0])
+            if len(rows) >= chunksize:
+                report['rows_read'] += len(rows)
+                yield _rows_to_frame(rows, header, lines)
+                rows = []
+                lines = []
+        if rows:
+            report['rows_read'] += len(rows)
+            yield _rows_to_frame(rows, header, lines)
+
+def _rows_to_frame(rows, header, lines):
+    chunk = pd.DataFrame(rows, columns=header, dtype=object)
+    chunk = chunk.where(chunk != '') # Empty fields become NaN, as with pd.read_csv; where() keeps the object dtype
+    chunk['SOURCE_LINE'] = lines
+    return chunk
+
+def parse_full_datetime_series(date_part, time_part):
+    """Vectorized parse of LASTLOGONDATE/LASTLOGONTIME pairs (including 오전/오후) into datetime64, NaT if unparseable."""
+    date_part = date_part.astype(object)
+    time_part = time_part.astype(object)
+    has_marker = time_part.str.contains('오전|오후', na=False)
+    time_str = time_part.str.replace('오전', 'AM', regex=False).str.replace('오후', 'PM', regex=False) # 오전 12:xx is just after midnight
+    full_str = date_part.str.cat(time_str, sep=' ') # NaN in either part stays NaN
+    marked = pd.to_datetime(full_str.where(has_marker), format='%Y-%m-%d %p %I:%M:%S', errors='coerce')
+    unmarked = pd.to_datetime(full_str.where(~has_marker), format='%Y-%m-%d %H:%M:%S', errors='coerce') # Assume 24-hour
+    return marked.where(has_marker, unmarked)
+
+def parse_ymd_or_ym_series(date_str):
+    """Vectorized parse of YYYYMMDD, YYYYMM (first day of month) or YYYY-MM-DD strings into datetime64, NaT if unparseable.
+
+    The 99991230 "never expires" sentinel is outside the datetime64 range and comes back as NaT.
+    """
+    s = date_str.astype(object).str.strip().str.replace('-', '', regex=False)
+    s = s.where(s.str.len() != 6, s + '01')
+    return pd.to_datetime(s.where(s.str.len() == 8), format='%Y%m%d', errors='coerce')
+
+def type_user_chunk(chunk):
+    """Adds the cleaned and parsed columns the zalmt0020 aggregations work on."""
+    if 'USERID' in chunk.columns:
+        userid = chunk['USERID'].str.strip()
+        chunk['USERID'] = userid.where(userid != '') # Blank USERIDs stay NaN so validation can reject them
+    if 'ROLETYPID' in chunk.columns:
+        chunk['CLEANED_ROLETYPID'] = chunk['ROLETYPID'].astype(str).str.strip()
+    if 'LASTLOGONDATE' in chunk.columns and 'LASTLOGONTIME' in chunk.columns:
+        chunk['LAST_LOGON_DATETIME'] = parse_full_datetime_series(chunk['LASTLOGONDATE'], chunk['LASTLOGONTIME'])
+    if 'EXPIRATIONENDDATE' in chunk.columns:
+        chunk['EXPIRATIONENDDATE'] = chunk['EXPIRATIONENDDATE'].str.strip()
+        chunk['EXPIRY_END_DATETIME'] = parse_ymd_or_ym_series(chunk['EXPIRATIONENDDATE'])
+        chunk['EXPIRY_NEVER'] = chunk['EXPIRATIONENDDATE'].eq(NEVER_EXPIRES)
+    if 'EXPIRATIONSTARTDATE' in chunk.columns:
+        chunk['EXPIRY_START_DATETIME'] = parse_ymd_or_ym_series(chunk['EXPIRATIONSTARTDATE'])
+    return chunk
+
+def iter_user_chunks(path, chunksize=DEFAULT_CHUNKSIZE, encoding=None, errors='quarantine', report=None):
+    """Streams zalmt0020 as typed chunks (see type_user_chunk)."""
+    for chunk in iter_csv_chunks(path, chunksize=chunksize, encoding=encoding, errors=errors, report=report):
+        yield type_user_chunk(chunk)